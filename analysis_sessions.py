@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from llmpostprocessing import format_llm_output
+
+# Live-workshop sessions: the client appends transcript segments and each
+# update sends only the new utterances, a short tail of recent context and the
+# previous deliverables to the LLM, instead of the whole transcript so far.
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "200"))
+SESSION_CONTEXT_UTTERANCES = int(os.getenv("SESSION_CONTEXT_UTTERANCES", "40"))
+SESSION_MAX_SEGMENT_CHARS = int(os.getenv("SESSION_MAX_SEGMENT_CHARS", "200000"))
+
+
+class UnparseableLLMResponse(Exception):
+    """
+    The LLM answered a session update without any recognisable deliverable block.
+    """
+
+
+class AnalysisSession:
+    """
+    Server-side state of one live session. Memory is bounded: only the last
+    SESSION_CONTEXT_UTTERANCES cleaned utterances are kept, and the condensed
+    state is the merged deliverables themselves.
+    """
+
+    def __init__(self, selected_outputs: List[str]):
+        self.id = uuid.uuid4().hex
+        self.selected_outputs = selected_outputs
+        self.context = deque(maxlen=SESSION_CONTEXT_UTTERANCES)
+        self.output: Dict[str, Any] = {}
+        self.segments = 0
+        self.utterances = 0
+        self.last_access = time.monotonic()
+        # Serialises updates so segments are folded into the state in order.
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> Optional[str]:
+        """
+        The merged deliverables in the fenced format the LLM is asked to answer
+        in, or None before the first update.
+        """
+        return format_llm_output(self.output) if self.output else None
+
+    def apply_update(self, new_lines: List[str], parsed: Dict[str, Any]) -> None:
+        if not parsed:
+            raise UnparseableLLMResponse("The LLM response contained no recognisable deliverables.")
+        # Blocks the LLM left out are kept from the previous state.
+        self.output = {**self.output, **parsed}
+        self.context.extend(new_lines)
+        self.segments += 1
+        self.utterances += len(new_lines)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "selected_outputs": self.selected_outputs,
+            "segments": self.segments,
+            "utterances": self.utterances,
+            "output": self.output,
+        }
+
+
+class SessionStore:
+    """
+    Holds live sessions in least-recently-used order. Sessions idle for longer
+    than SESSION_IDLE_SECONDS are evicted on access, and the oldest session is
+    dropped once SESSION_MAX_COUNT is exceeded.
+    """
+
+    def __init__(self, idle_seconds: float = SESSION_IDLE_SECONDS, max_sessions: int = SESSION_MAX_COUNT):
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, AnalysisSession]" = OrderedDict()
+
+    def _evict_idle(self, now: float) -> None:
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_access <= self.idle_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+    def create(self, selected_outputs: List[str]) -> AnalysisSession:
+        session = AnalysisSession(selected_outputs)
+        with self._lock:
+            self._evict_idle(session.last_access)
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[AnalysisSession]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
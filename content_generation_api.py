@@ -1,33 +1,165 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Header, Request, Depends
 from typing import List, Optional
+import asyncio
+import functools
 import json
+import logging
+import math
 import os
 import tempfile  # NEW: Needed for creating temporary files
 from pathlib import Path  # NEW: Useful for file path manipulation
 
 from process_analyzer import AnalysisResult
+from analysis_sessions import AnalysisSession, SESSION_MAX_SEGMENT_CHARS, SessionStore, UnparseableLLMResponse
 from content_generation_core import ProcessAnalyzer
+from llm_router import LLMRouter
 from file_content_extractor import extract_content  # NEW: Import the unified extractor function
+from prompt_repository import get_prompt_version
+from request_deadline import CancellationStats, Deadline, DeadlineExceeded, RequestCancelled
+from request_profiler import RequestProfile, profiled, request_profile
+from transcript_similarity import NearDuplicateIndex
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger("content_generation_api")
+
 router = APIRouter()
 
-ANALYZER = ProcessAnalyzer(
-    azure_api_key=os.getenv("Azure_Open_api_key"),
-    azure_endpoint=os.getenv("Alta_Azure_end_point")
-)
+# Clients may shorten or extend the budget with the X-Request-Timeout header (seconds).
+DEFAULT_REQUEST_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_DEFAULT_TIMEOUT_SECONDS", "300"))
+MAX_REQUEST_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_MAX_TIMEOUT_SECONDS", "600"))
+DISCONNECT_POLL_SECONDS = 0.5
+
+CANCELLATION_STATS = CancellationStats()
+
+# Near-duplicate handling, overridable per request with the 'near_duplicate' form field:
+#   off   - always run a fresh analysis
+#   offer - return an empty output plus the prior result and its similarity for the client to accept
+#   reuse - return the prior result as the output
+# Signatures and indexing cost CPU and memory on every request, so nothing is indexed
+# (and the per-request field has no effect) unless NEAR_DUPLICATE_MODE is not "off"
+# or NEAR_DUPLICATE_INDEX=true.
+NEAR_DUPLICATE_MODES = ("off", "offer", "reuse")
+NEAR_DUPLICATE_MODE = os.getenv("NEAR_DUPLICATE_MODE", "off")
+NEAR_DUPLICATE_ENABLED = NEAR_DUPLICATE_MODE != "off" or os.getenv("NEAR_DUPLICATE_INDEX", "false").lower() == "true"
+NEAR_DUPLICATES = NearDuplicateIndex()
+
+SESSIONS = SessionStore()
+
+_ANALYZER: Optional[ProcessAnalyzer] = None
+
+
+def get_analyzer() -> ProcessAnalyzer:
+    # Built on first use (or by the startup warm-up) rather than at import time.
+    global _ANALYZER
+    if _ANALYZER is None:
+        _ANALYZER = ProcessAnalyzer(router=LLMRouter.from_env())
+    return _ANALYZER
+
+
+async def _run_in_thread(request: Request, deadline: Deadline, stage: str, func, *args):
+    """
+    Runs blocking work in a worker thread while watching for client disconnects
+    and deadline expiry. The worker observes deadline.cancel() at its next check.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if task.done():
+            break
+        if not deadline.cancelled and await request.is_disconnected():
+            logger.info(f"Client disconnected during {stage}; cancelling upstream work.")
+            deadline.cancel()
+        if deadline.expired:
+            # Stop waiting now; the worker aborts at its next check and its result is discarded.
+            deadline.cancel()
+            task.add_done_callback(lambda t: t.exception())
+            raise DeadlineExceeded(deadline.stage or stage)
+    return task.result()
+
+
+def _aborted(error: Exception) -> HTTPException:
+    CANCELLATION_STATS.record(error)
+    if isinstance(error, RequestCancelled):
+        # 499 "client closed request"; nobody is listening, but it keeps the access log honest.
+        return HTTPException(status_code=499, detail=str(error))
+    return HTTPException(status_code=504, detail=str(error))
+
+
+def _deadline_from_header(request_timeout: Optional[float]) -> Deadline:
+    # nan passes a plain "<= 0" check and would make the deadline impossible to enforce.
+    if request_timeout is not None and (not math.isfinite(request_timeout) or request_timeout <= 0):
+        raise HTTPException(status_code=422, detail="X-Request-Timeout must be a positive number of seconds.")
+    return Deadline(min(request_timeout or DEFAULT_REQUEST_TIMEOUT_SECONDS, MAX_REQUEST_TIMEOUT_SECONDS))
+
+
+def _parse_selected_outputs(selected_outputs_str: str) -> List[str]:
+    try:
+        selected_outputs: List[str] = json.loads(selected_outputs_str)
+        if not all(isinstance(item, str) for item in selected_outputs):
+            raise ValueError("All items in selected_outputs must be strings.")
+        return selected_outputs
+    except (json.JSONDecodeError, ValueError) as e:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid format for selected_outputs. Expected a JSON list of strings. Error: {str(e)}"
+        )
+
+
+def _analyze_with_reuse(selected_outputs: List[str], transcript_text: str, deadline: Deadline,
+                        near_duplicate_mode: str) -> AnalysisResult:
+    analyzer = get_analyzer()
+    cleaned_lines = analyzer.light_cleanup(analyzer.load_transcript(transcript_text))
+    signature, scope = None, None
+    if NEAR_DUPLICATE_ENABLED:
+        signature = NEAR_DUPLICATES.signature(cleaned_lines)
+        scope = (tuple(sorted(selected_outputs)), get_prompt_version(selected_outputs))
+
+    if signature is not None and near_duplicate_mode != "off":
+        match = NEAR_DUPLICATES.lookup(signature, scope)
+        if match:
+            logger.info(f"Near-duplicate transcript found (similarity {match['similarity']}).")
+            near_duplicate = {"analysis_id": match["analysis_id"], "similarity": match["similarity"]}
+            if near_duplicate_mode == "reuse":
+                return AnalysisResult(output=match["result"], near_duplicate=near_duplicate)
+            return AnalysisResult(output={}, near_duplicate={**near_duplicate, "output": match["result"]})
+
+    output = analyzer.analyze(
+        selected_outputs=selected_outputs,
+        transcript_text=transcript_text,
+        deadline=deadline,
+        cleaned_lines=cleaned_lines
+    )
+    if signature is not None and output:
+        NEAR_DUPLICATES.add(signature, scope, output)
+    return AnalysisResult(output=output)
+
+
+@router.get("/analyze/cancellations")
+async def analyze_cancellations():
+    return CANCELLATION_STATS.snapshot()
+
+
+@router.get("/llm/endpoints")
+async def llm_endpoint_stats():
+    return get_analyzer().router.stats()
 
 
 @router.post("/analyze")
 async def analyze_process(
+        request: Request,
         # Accept selected_outputs as a string from the form data
         selected_outputs_str: str = Form(..., alias="selected_outputs"),
         # Make the file and text inputs optional
         transcript_file: Optional[UploadFile] = File(None),
-        transcript_text: Optional[str] = Form(None)):
+        transcript_text: Optional[str] = Form(None),
+        near_duplicate: Optional[str] = Form(None),
+        request_timeout: Optional[float] = Header(None, alias="X-Request-Timeout"),
+        profile: Optional[RequestProfile] = Depends(request_profile)):
+
+    deadline = _deadline_from_header(request_timeout)
 
     if not transcript_file and not transcript_text:
         raise HTTPException(
@@ -35,16 +167,15 @@ async def analyze_process(
             detail="Either a 'transcript_file' or 'transcript_text' must be provided."
         )
 
-    try:
-        selected_outputs: List[str] = json.loads(selected_outputs_str)
-        if not all(isinstance(item, str) for item in selected_outputs):
-            raise ValueError("All items in selected_outputs must be strings.")
-    except (json.JSONDecodeError, ValueError) as e:
+    near_duplicate_mode = near_duplicate or NEAR_DUPLICATE_MODE
+    if near_duplicate_mode not in NEAR_DUPLICATE_MODES:
         raise HTTPException(
             status_code=422,
-            detail=f"Invalid format for selected_outputs. Expected a JSON list of strings. Error: {str(e)}"
+            detail=f"Invalid near_duplicate mode '{near_duplicate_mode}'. Expected one of {list(NEAR_DUPLICATE_MODES)}."
         )
 
+    selected_outputs = _parse_selected_outputs(selected_outputs_str)
+
     if transcript_file:
         temp_file_path = None
         extracted_content = None
@@ -61,7 +192,10 @@ async def analyze_process(
                 temp_file.write(content)
                 temp_file.flush()
 
-            extracted_content = extract_content(temp_file_path)
+            extracted_content = await _run_in_thread(
+                request, deadline, "extraction",
+                profiled(profile, "extraction", extract_content), temp_file_path, deadline
+            )
 
             if extracted_content is None:
                 raise HTTPException(
@@ -76,6 +210,8 @@ async def analyze_process(
                 status_code=422,
                 detail=f"Error: {str(e)}"
             )
+        except (DeadlineExceeded, RequestCancelled) as e:
+            raise _aborted(e)
         except Exception as e:
             print(f"File extraction error: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to process uploaded file: {str(e)}")
@@ -92,11 +228,97 @@ async def analyze_process(
         )
 
     try:
-        output = ANALYZER.analyze(
-            selected_outputs=selected_outputs,
-            transcript_text=transcript_text
+        return await _run_in_thread(
+            request, deadline, "analysis",
+            functools.partial(
+                profiled(profile, "analysis", _analyze_with_reuse),
+                selected_outputs=selected_outputs,
+                transcript_text=transcript_text,
+                deadline=deadline,
+                near_duplicate_mode=near_duplicate_mode
+            )
         )
-        return AnalysisResult(output=output)
+    except (DeadlineExceeded, RequestCancelled) as e:
+        raise _aborted(e)
     except Exception as e:
         print(f"Core analysis error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# -------------------------------
+# Live sessions
+# -------------------------------
+def _update_session(session: AnalysisSession, transcript_text: str, deadline: Deadline) -> AnalysisResult:
+    analyzer = get_analyzer()
+    with session.lock:
+        new_lines = analyzer.light_cleanup(analyzer.load_transcript(transcript_text))
+        if new_lines:
+            parsed = analyzer.analyze_increment(
+                selected_outputs=session.selected_outputs,
+                current_deliverables=session.state,
+                context_lines=list(session.context),
+                new_lines=new_lines,
+                deadline=deadline
+            )
+            # Raises without touching the session when nothing could be parsed.
+            session.apply_update(new_lines, parsed)
+        return AnalysisResult(output=session.output)
+
+
+def _get_session_or_404(session_id: str) -> AnalysisSession:
+    session = SESSIONS.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return session
+
+
+@router.post("/sessions")
+async def create_session(selected_outputs_str: str = Form(..., alias="selected_outputs")):
+    session = SESSIONS.create(_parse_selected_outputs(selected_outputs_str))
+    return session.info()
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    return _get_session_or_404(session_id).info()
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not SESSIONS.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return {"message": f"Session {session_id} deleted successfully"}
+
+
+@router.post("/sessions/{session_id}/segments")
+async def append_session_segment(
+        session_id: str,
+        request: Request,
+        transcript_text: str = Form(...),
+        request_timeout: Optional[float] = Header(None, alias="X-Request-Timeout"),
+        profile: Optional[RequestProfile] = Depends(request_profile)):
+    """
+    Append only the new part of a live transcript and return the updated deliverables.
+    """
+    deadline = _deadline_from_header(request_timeout)
+    session = _get_session_or_404(session_id)
+
+    if len(transcript_text) > SESSION_MAX_SEGMENT_CHARS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Segment exceeds {SESSION_MAX_SEGMENT_CHARS} characters; send smaller segments more often."
+        )
+
+    try:
+        return await _run_in_thread(
+            request, deadline, "analysis",
+            profiled(profile, "analysis", _update_session), session, transcript_text, deadline
+        )
+    except (DeadlineExceeded, RequestCancelled) as e:
+        raise _aborted(e)
+    except UnparseableLLMResponse as e:
+        print(f"Session analysis error: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        print(f"Session analysis error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,20 +1,30 @@
 import os
 import re
 import json
-from typing import List
+from typing import Any, Dict, List
 from typing import Optional
-import requests
 import logging
 from prompt_repository import get_core_prompt, get_modular_prompts
 from llmpostprocessing import parse_llm_output
+from llm_router import LLMEndpoint, LLMRouter
+from request_deadline import Deadline, check_deadline
 
 logger = logging.getLogger("process_analysis_service")
 
+INCREMENTAL_INSTRUCTIONS = (
+    "\n\n-----------------------\nINCREMENTAL UPDATE\n-----------------------\n"
+    "The transcript is from a live session and arrives in segments. CURRENT DELIVERABLES "
+    "were produced from everything before the NEW TRANSCRIPT segment; RECENT CONTEXT repeats "
+    "the last utterances before it for continuity. Update the deliverables so they also cover "
+    "the new segment, and return ALL expected outputs in full in the same format."
+)
+
 
 class ProcessAnalyzer:
-    def __init__(self, azure_api_key: str, azure_endpoint: str):
-        self.azure_api_key = azure_api_key
-        self.azure_endpoint = azure_endpoint
+    def __init__(self, azure_api_key: Optional[str] = None, azure_endpoint: Optional[str] = None,
+                 router: Optional[LLMRouter] = None):
+        # Either a single endpoint (legacy) or a router over several deployments.
+        self.router = router or LLMRouter([LLMEndpoint("default", azure_endpoint, azure_api_key)])
         self.max_tokens = 4000
 
     # This method is now simplified to only accept and process raw text
@@ -34,43 +44,76 @@ class ProcessAnalyzer:
                 cleaned.append(utterance)
         return cleaned
 
-    def call_llm(self, prompt: str) -> str:
-        headers = {"api-key": self.azure_api_key, "Content-Type": "application/json"}
+    def call_llm(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
         body = {
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": self.max_tokens,
-            "temperature": 0.0
+            "temperature": 0.0,
+            # Streaming lets us check the deadline between chunks and stop the
+            # completion (and its billing) by closing the connection.
+            "stream": True
         }
-        response = requests.post(self.azure_endpoint, headers=headers, json=body)
-        if not response.ok:
-            logger.error(f"Azure API call failed: {response.status_code} {response.text}")
-            raise Exception(f"Azure API Error: {response.text}")
-
-        return response.json()['choices'][0]['message']['content']
-
-    # This method is now simplified to only accept transcript_text
-    def analyze(self, selected_outputs: List[str], transcript_text: str) -> str:
-        print("transcript_text:", transcript_text)
+        return self.router.complete(body, deadline)
 
-        transcript_lines = self.load_transcript(transcript_text=transcript_text)
-        cleaned_lines = self.light_cleanup(transcript_lines)
-        raw_text = " ".join(cleaned_lines)
+    def warm_up(self, timeout: float = 10.0) -> None:
+        self.router.warm_up(timeout)
 
+    def build_prompt(self, selected_outputs: List[str], deadline: Optional[Deadline] = None) -> str:
+        check_deadline(deadline, "prompt_fetch")
         CORE_PROMPT = get_core_prompt()
         PROMPTS = get_modular_prompts(selected_outputs)
+        check_deadline(deadline, "prompt_fetch")
 
         deliverables_prompt = "\n".join([PROMPTS[o] for o in selected_outputs])
-        final_prompt = (
+        return (
                 CORE_PROMPT
                 + "\n\n-----------------------\nEXPECTED OUTPUTS\n-----------------------\n"
                 + deliverables_prompt
         )
 
+    # This method is now simplified to only accept transcript_text
+    def analyze(self, selected_outputs: List[str], transcript_text: str, deadline: Optional[Deadline] = None,
+                cleaned_lines: Optional[List[str]] = None) -> str:
+        print("transcript_text:", transcript_text)
+
+        # Callers that already ran light_cleanup (e.g. for duplicate detection) pass its output.
+        if cleaned_lines is None:
+            transcript_lines = self.load_transcript(transcript_text=transcript_text)
+            cleaned_lines = self.light_cleanup(transcript_lines)
+        raw_text = " ".join(cleaned_lines)
+
+        final_prompt = self.build_prompt(selected_outputs, deadline)
+
         full_prompt = final_prompt + f"\n---TRANSCRIPT START---\n{raw_text}\n---TRANSCRIPT END---"
         print(full_prompt)
 
         logger.info(f"Sending analysis prompt to LLM...{full_prompt}")
-        llm_response= self.call_llm(full_prompt)
+        llm_response= self.call_llm(full_prompt, deadline)
         print(f"llm responded already, {llm_response}",)
         return parse_llm_output(llm_response)
 
+    def analyze_increment(self, selected_outputs: List[str], current_deliverables: Optional[str],
+                          context_lines: List[str], new_lines: List[str],
+                          deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Update a live session's deliverables from the new utterances only.
+        current_deliverables is the session state in fenced-block format, or
+        None for the first segment. Returns the parsed LLM output.
+        """
+        final_prompt = self.build_prompt(selected_outputs, deadline)
+        new_text = " ".join(new_lines)
+
+        if current_deliverables is None:
+            full_prompt = final_prompt + f"\n---TRANSCRIPT START---\n{new_text}\n---TRANSCRIPT END---"
+        else:
+            full_prompt = (
+                    final_prompt
+                    + INCREMENTAL_INSTRUCTIONS
+                    + f"\n---CURRENT DELIVERABLES START---\n{current_deliverables}\n---CURRENT DELIVERABLES END---"
+                    + f"\n---RECENT CONTEXT START---\n{' '.join(context_lines)}\n---RECENT CONTEXT END---"
+                    + f"\n---NEW TRANSCRIPT START---\n{new_text}\n---NEW TRANSCRIPT END---"
+            )
+
+        logger.info(f"Sending incremental analysis prompt to LLM ({len(new_lines)} new utterances)")
+        llm_response = self.call_llm(full_prompt, deadline)
+        return parse_llm_output(llm_response)
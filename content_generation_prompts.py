@@ -10,6 +10,8 @@ from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter
 
+from prompt_repository import invalidate_prompt_cache
+
 # -------------------------------
 # Load ENV
 # -------------------------------
@@ -96,6 +98,7 @@ class PromptOperation:
 
             new_prompt = cur.fetchone()
             conn.commit()
+            invalidate_prompt_cache()
             return Prompt(**new_prompt)
         except Exception as e:
             logger.error("Error creating prompt: %s", str(e))
@@ -113,6 +116,7 @@ class PromptOperation:
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Prompt not found")
             conn.commit()
+            invalidate_prompt_cache()
         except Exception as e:
             logger.error("Error deleting prompt: %s", str(e))
             conn.rollback()
@@ -159,6 +163,7 @@ class PromptOperation:
                 raise HTTPException(status_code=404, detail="Prompt not found.")
 
             conn.commit()
+            invalidate_prompt_cache()
             return Prompt(**updated_prompt)
 
         except Exception as e:
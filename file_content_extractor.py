@@ -1,23 +1,31 @@
 import os
 from pathlib import Path
 from typing import Optional
-from pypdf import PdfReader
-from docx import Document
+
+from request_deadline import Deadline, DeadlineExceeded, RequestCancelled, check_deadline
 
 # --- Required External Libraries ---
 # You need to install these libraries to run this code:
 # pip install pypdf python-docx
+#
+# They are imported inside the extractor functions so that importing this
+# module (and therefore starting the API) does not pay for loading them.
 
 
-def extract_text_from_pdf(file_path: Path) -> Optional[str]:
+def extract_text_from_pdf(file_path: Path, deadline: Optional[Deadline] = None) -> Optional[str]:
     text = ""
     try:
+        from pypdf import PdfReader
+
         reader = PdfReader(file_path)
         # Iterate over all pages and accumulate text
         for page in reader.pages:
+            check_deadline(deadline, "extraction")
             # page.extract_text() returns None if no text is found, so we handle that
             text += page.extract_text() or ""
         return text.strip()
+    except (DeadlineExceeded, RequestCancelled):
+        raise
     except Exception as e:
         print(f"Error extracting text from PDF '{file_path.name}': {e}")
         return None
@@ -27,6 +35,8 @@ def extract_text_from_docx(file_path: Path) -> Optional[str]:
     print("file made it to docx extraction function")
     text = []
     try:
+        from docx import Document
+
         document = Document(file_path)
         print("file made it to docx extraction function22")
         # Read all paragraphs and join them with newlines
@@ -50,8 +60,9 @@ def extract_text_from_txt(file_path: Path) -> Optional[str]:
         return None
 
 
-def extract_content(file_path_str: str) -> Optional[str]:
+def extract_content(file_path_str: str, deadline: Optional[Deadline] = None) -> Optional[str]:
     file_path = Path(file_path_str)
+    check_deadline(deadline, "extraction")
 
     if not file_path.exists():
         print(f"File not found: {file_path_str}")
@@ -61,7 +72,7 @@ def extract_content(file_path_str: str) -> Optional[str]:
     extension = file_path.suffix.lower()
 
     if extension == ".pdf":
-        return extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path, deadline)
     elif extension == ".docx":
         return extract_text_from_docx(file_path)
     elif extension == ".txt":
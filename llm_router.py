@@ -0,0 +1,502 @@
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from request_deadline import Deadline, DeadlineExceeded, RequestCancelled, check_deadline
+
+logger = logging.getLogger("llm_router")
+
+# LLM_ENDPOINTS is a JSON list of deployments, e.g.
+#   [{"name": "eastus", "url": "https://.../chat/completions?api-version=...",
+#     "api_key": "...", "weight": 2, "quota_per_minute": 120}, ...]
+# When it is not set, the single Alta_Azure_end_point / Azure_Open_api_key pair is used.
+EWMA_ALPHA = float(os.getenv("LLM_EWMA_ALPHA", "0.2"))
+FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))
+COOLDOWN_SECONDS = float(os.getenv("LLM_COOLDOWN_SECONDS", "30"))
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Share of primary picks sent to a random non-best healthy endpoint, so endpoints
+# without samples (or recovering ones) still get tried.
+EXPLORE_RATE = float(os.getenv("LLM_EXPLORE_RATE", "0.05"))
+DEFAULT_LATENCY_PRIOR = 1.0
+LATENCY_WINDOW = 100
+
+
+class _RateLimited(Exception):
+    def __init__(self, retry_after: float, text: str):
+        super().__init__(f"Azure API Error: {text}")
+        self.retry_after = retry_after
+
+
+class LLMRequestRejected(Exception):
+    """
+    The deployment rejected the request itself (4xx other than 408/429, e.g.
+    context_length_exceeded or a content filter). Retrying elsewhere would fail
+    the same way, so it neither counts against the endpoint nor fails over.
+    """
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"Azure API Error: {text}")
+        self.status_code = status_code
+
+
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+
+def _parse_retry_after(value: Optional[str]) -> float:
+    """
+    Retry-After is either delay-seconds or an HTTP date; anything else falls back to COOLDOWN_SECONDS.
+    """
+    if not value:
+        return COOLDOWN_SECONDS
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return COOLDOWN_SECONDS
+
+
+class LLMEndpoint:
+    """
+    One Azure OpenAI deployment plus the health and latency statistics used
+    to route to it. All statistics are guarded by a lock because attempts run
+    on the router's worker threads.
+    """
+
+    def __init__(self, name: str, url: str, api_key: Optional[str], weight: float = 1.0,
+                 quota_per_minute: Optional[int] = None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.weight = weight
+        self.quota_per_minute = quota_per_minute
+        # A session per endpoint keeps its TLS connection alive between calls.
+        self.session = requests.Session()
+
+        self._lock = threading.Lock()
+        self._recent_requests = deque()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    # -------------------------------
+    # Health and scoring
+    # -------------------------------
+    def _requests_last_minute(self, now: float) -> int:
+        while self._recent_requests and now - self._recent_requests[0] > 60:
+            self._recent_requests.popleft()
+        return len(self._recent_requests)
+
+    def available(self, now: float) -> bool:
+        with self._lock:
+            if now < self.cooldown_until:
+                return False
+            if self.quota_per_minute is not None and self._requests_last_minute(now) >= self.quota_per_minute:
+                return False
+            return True
+
+    def score(self, latency_prior: float) -> float:
+        """
+        Lower is better. Endpoints without latency samples use latency_prior, so
+        their error rate still counts against them.
+        """
+        with self._lock:
+            latency = self.latency_ewma if self.latency_ewma is not None else latency_prior
+            return latency * (1 + self.in_flight) * (1 + 4 * self.error_ewma) / self.weight
+
+    def p95_latency(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+            return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _start(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self._recent_requests.append(time.monotonic())
+
+    def _record_success(self, latency: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.successes += 1
+            self.consecutive_failures = 0
+            self._latencies.append(latency)
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma)
+            self.error_ewma = (1 - EWMA_ALPHA) * self.error_ewma
+
+    def _record_failure(self, cooldown: Optional[float] = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.error_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_ewma
+            if cooldown is None and self.consecutive_failures >= FAILURE_THRESHOLD:
+                cooldown = COOLDOWN_SECONDS
+            if cooldown is not None:
+                self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+                logger.warning(f"LLM endpoint '{self.name}' cooling down for {cooldown:.0f}s")
+
+    def _record_cancelled(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.cancelled += 1
+
+    def _record_rejected(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.rejected += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        p95 = self.p95_latency()
+        with self._lock:
+            return {
+                "name": self.name,
+                "weight": self.weight,
+                "quota_per_minute": self.quota_per_minute,
+                "requests_last_minute": self._requests_last_minute(now),
+                "in_flight": self.in_flight,
+                "latency_ewma_seconds": self.latency_ewma,
+                "latency_p95_seconds": p95,
+                "error_rate_ewma": self.error_ewma,
+                "successes": self.successes,
+                "failures": self.failures,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+                "cooling_down_seconds": max(0.0, self.cooldown_until - now),
+            }
+
+    # -------------------------------
+    # HTTP
+    # -------------------------------
+    def complete(self, body: Dict[str, Any], deadline: Deadline) -> str:
+        """
+        Send one chat completion request. Streamed responses are read chunk by
+        chunk so the deadline can abort them; closing the response stops the
+        upstream generation.
+        """
+        self._start()
+        started = time.monotonic()
+        try:
+            result = self._post(body, deadline)
+        except (RequestCancelled, DeadlineExceeded):
+            self._record_cancelled()
+            raise
+        except LLMRequestRejected:
+            self._record_rejected()
+            raise
+        except _RateLimited as e:
+            self._record_failure(cooldown=e.retry_after)
+            raise
+        except Exception:
+            self._record_failure()
+            raise
+        self._record_success(time.monotonic() - started)
+        return result
+
+    def _post(self, body: Dict[str, Any], deadline: Deadline) -> str:
+        check_deadline(deadline, "llm_call")
+        headers = {"api-key": self.api_key, "Content-Type": "application/json"}
+        remaining = deadline.remaining()
+        # requests rejects a zero timeout, so a budget that ran out since the check is a deadline miss.
+        if remaining <= 0:
+            raise DeadlineExceeded("llm_call")
+        timeout = None if math.isinf(remaining) else remaining
+        try:
+            response = self.session.post(self.url, headers=headers, json=body, stream=True, timeout=timeout)
+        except requests.Timeout:
+            raise DeadlineExceeded("llm_call")
+
+        with response:
+            if response.status_code == 429:
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                logger.error(f"Azure API quota exhausted on '{self.name}': {response.text}")
+                raise _RateLimited(retry_after, response.text)
+            if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+                logger.error(f"Azure API rejected the request on '{self.name}': {response.status_code} {response.text}")
+                raise LLMRequestRejected(response.status_code, response.text)
+            if not response.ok:
+                logger.error(f"Azure API call failed on '{self.name}': {response.status_code} {response.text}")
+                raise Exception(f"Azure API Error: {response.text}")
+
+            if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                return response.json()['choices'][0]['message']['content']
+            return self._read_stream(response, deadline)
+
+    def _read_stream(self, response: requests.Response, deadline: Deadline) -> str:
+        parts = []
+        try:
+            # SSE is UTF-8 by spec; decode_unicode would fall back to ISO-8859-1 without a charset.
+            for raw_line in response.iter_lines():
+                check_deadline(deadline, "llm_call")
+                line = raw_line.decode("utf-8")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                for choice in json.loads(data).get("choices", []):
+                    parts.append((choice.get("delta") or {}).get("content") or "")
+        except (requests.Timeout, requests.ConnectionError):
+            # requests surfaces read timeouts while streaming as ConnectionError.
+            if deadline.expired:
+                raise DeadlineExceeded("llm_call")
+            raise
+        return "".join(parts)
+
+    def warm_up(self, timeout: float = 10.0) -> None:
+        # Any response (even 4xx) means the TCP/TLS connection is now pooled in the session.
+        self.session.head(self.url, timeout=timeout)
+
+
+class LLMRouter:
+    """
+    Routes completions across several deployments. Each call goes to the
+    best-scoring available endpoint; if it fails, or (with hedging enabled)
+    runs past that endpoint's p95 latency, a second attempt is sent to the
+    next best endpoint and the first successful response wins.
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], hedge_enabled: bool = HEDGE_ENABLED, max_workers: int = 32):
+        if not endpoints:
+            raise ValueError("At least one LLM endpoint must be configured.")
+        self.endpoints = endpoints
+        self.hedge_enabled = hedge_enabled
+        self.max_attempts = 2
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self._lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.failovers = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMRouter":
+        raw = os.getenv("LLM_ENDPOINTS")
+        if raw:
+            endpoints = [
+                LLMEndpoint(
+                    name=item.get("name", f"endpoint-{i}"),
+                    url=item["url"],
+                    api_key=item.get("api_key", os.getenv("Azure_Open_api_key")),
+                    weight=float(item.get("weight", 1.0)),
+                    quota_per_minute=item.get("quota_per_minute"),
+                )
+                for i, item in enumerate(json.loads(raw))
+            ]
+        else:
+            endpoints = [LLMEndpoint("default", os.getenv("Alta_Azure_end_point"), os.getenv("Azure_Open_api_key"))]
+        return cls(endpoints)
+
+    def _latency_prior(self) -> float:
+        # Median EWMA latency of the sampled endpoints.
+        sampled = sorted(e.latency_ewma for e in self.endpoints if e.latency_ewma is not None)
+        return sampled[len(sampled) // 2] if sampled else DEFAULT_LATENCY_PRIOR
+
+    def pick(self, exclude: tuple = (), explore: bool = False, fallback: bool = False) -> Optional[LLMEndpoint]:
+        """
+        Best available endpoint not in exclude. With fallback (primary picks
+        only) and nothing available, the endpoint that leaves cooldown first is
+        returned instead of None; hedges and failovers never go to an endpoint
+        that is cooling down or over its quota.
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        healthy = [e for e in candidates if e.available(now)]
+        if healthy:
+            prior = self._latency_prior()
+            best = min(healthy, key=lambda e: e.score(prior))
+            others = [e for e in healthy if e is not best]
+            if explore and others and random.random() < EXPLORE_RATE:
+                return random.choice(others)
+            return best
+        # Nothing healthy: fall back to whichever endpoint leaves cooldown first.
+        if fallback and candidates:
+            return min(candidates, key=lambda e: e.cooldown_until)
+        return None
+
+    def complete(self, body: Dict[str, Any], deadline: Optional[Deadline] = None) -> str:
+        root = deadline or Deadline(math.inf)
+        primary = self.pick(explore=True, fallback=True)
+        attempts = {}
+        used = []
+        hedged = False
+
+        def launch(endpoint: LLMEndpoint):
+            child = root.child()
+            future = self._executor.submit(endpoint.complete, body, child)
+            attempts[future] = (endpoint, child)
+            used.append(endpoint)
+
+        launch(primary)
+        hedge_delay = primary.p95_latency() if self.hedge_enabled else None
+        last_error: Optional[Exception] = None
+
+        while attempts:
+            timeout = hedge_delay if len(used) < self.max_attempts else None
+            done, _ = wait(attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                hedge_delay = None
+                backup = self.pick(exclude=tuple(used))
+                if backup is not None:
+                    logger.info(f"Hedging LLM call from '{primary.name}' to '{backup.name}'")
+                    with self._lock:
+                        self.hedges_sent += 1
+                    hedged = True
+                    launch(backup)
+                continue
+
+            for future in done:
+                endpoint, _ = attempts.pop(future)
+                try:
+                    result = future.result()
+                except (RequestCancelled, DeadlineExceeded):
+                    if root.cancelled or root.expired:
+                        raise
+                    continue
+                except LLMRequestRejected:
+                    # The request itself is bad; other attempts would be rejected too.
+                    for _, other in attempts.values():
+                        other.cancel()
+                    raise
+                except Exception as e:
+                    last_error = e
+                    continue
+
+                for _, other in attempts.values():
+                    other.cancel()
+                if hedged and endpoint is not primary:
+                    with self._lock:
+                        self.hedges_won += 1
+                return result
+
+            # The only outstanding attempt failed: fail over once to another endpoint.
+            if not attempts and len(used) < self.max_attempts:
+                check_deadline(root, "llm_call")
+                backup = self.pick(exclude=tuple(used))
+                if backup is not None:
+                    logger.warning(f"LLM call to '{primary.name}' failed, failing over to '{backup.name}'")
+                    with self._lock:
+                        self.failovers += 1
+                    launch(backup)
+
+        raise last_error or Exception("Azure API Error: all LLM endpoints failed.")
+
+    def warm_up(self, timeout: float = 10.0) -> None:
+        errors = []
+        for endpoint in self.endpoints:
+            try:
+                endpoint.warm_up(timeout)
+            except Exception as e:
+                logger.warning(f"Warm-up of LLM endpoint '{endpoint.name}' failed: {e}")
+                errors.append(e)
+        if len(errors) == len(self.endpoints):
+            raise errors[-1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            router_stats = {
+                "hedge_enabled": self.hedge_enabled,
+                "hedges_sent": self.hedges_sent,
+                "hedges_won": self.hedges_won,
+                "failovers": self.failovers,
+            }
+        return {**router_stats, "endpoints": [e.stats() for e in self.endpoints]}
+
+
+def main():
+    """
+    Routes a batch of calls across four local mock deployments that stream
+    text/event-stream like Azure (fast, slow, always failing, and rate limited
+    with an HTTP-date Retry-After) and checks where the traffic went. Two more
+    mocks answer 400 to check that rejected requests are not retried.
+    """
+    from email.utils import formatdate
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    def mock_server(port: int, delay: float, status: int = 200):
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                if status != 200:
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", formatdate(time.time() + 60, usegmt=True))
+                    self.end_headers()
+                    self.wfile.write(b"mock failure")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for word in ("ok ", "from ", f"{port} ", "✓"):
+                    chunk = {"choices": [{"delta": {"content": word}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return LLMEndpoint(f"mock-{port}", f"http://127.0.0.1:{port}/", "test-key")
+
+    fast, slow, failing, limited = (
+        mock_server(8901, 0.02), mock_server(8902, 0.2), mock_server(8903, 0.02, 500), mock_server(8904, 0.02, 429)
+    )
+    router = LLMRouter([fast, slow, failing, limited], hedge_enabled=True)
+    body = {"messages": [{"role": "user", "content": "ping"}], "stream": True}
+    try:
+        limited.complete(body, Deadline(5))
+    except _RateLimited:
+        pass
+    assert limited.cooldown_until - time.monotonic() > 30, "HTTP-date Retry-After ignored"
+
+    results = [router.complete(body, Deadline(5)) for _ in range(100)]
+    stats = router.stats()
+    print(json.dumps(stats, indent=2))
+
+    assert all(r.startswith("ok from ") and r.endswith("✓") for r in results), "garbled or missing stream content"
+    assert fast.successes > 80, "traffic should settle on the fastest healthy endpoint"
+    assert failing.failures <= 10, "a failing endpoint should only see exploration and cooldown retries"
+    assert limited.failures == 1, "a rate-limited endpoint should stay out of rotation during its cooldown"
+    assert router.pick(exclude=(fast, slow, failing)) is None, "a backup pick must skip endpoints in cooldown"
+
+    rejecting = LLMRouter([mock_server(8905, 0.02, 400), mock_server(8906, 0.02, 400)])
+    for _ in range(3):
+        try:
+            rejecting.complete(body, Deadline(5))
+        except LLMRequestRejected:
+            pass
+    rejected_stats = rejecting.stats()
+    assert rejected_stats["failovers"] == 0, "a rejected request must not fail over"
+    assert sum(e["rejected"] for e in rejected_stats["endpoints"]) == 3, "each rejected request is sent once"
+    assert all(e.available(time.monotonic()) for e in rejecting.endpoints), "rejections must not cool endpoints down"
+    print("all routing checks passed")
+
+
+if __name__ == "__main__":
+    main()
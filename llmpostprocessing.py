@@ -116,6 +116,26 @@ def parse_llm_output(llm_output_string: str) -> Dict[str, Any]:
 
     return output_data
 
+
+def format_llm_output(output_data: Dict[str, Any]) -> str:
+    """
+    Serialises parsed deliverables back into the fenced-block format that
+    parse_llm_output reads, so that parse_llm_output(format_llm_output(d)) == d.
+    """
+    blocks = []
+    for key, value in output_data.items():
+        if key in ('summary_table', 'process_description'):
+            # Backslashes are written as \u005c because clean_json_string collapses doubled ones.
+            content = json.dumps(value, indent=2, ensure_ascii=False).replace('\\\\', '\\u005c')
+            blocks.append(f"```json\n{content}\n```")
+        elif key == 'bpmn_diagram':
+            blocks.append(f"```xml\n{value}\n```")
+        elif key in ('synthesia_script', 'media_mapping'):
+            blocks.append(f"```text\n{value}\n```")
+        else:
+            logger.warning(f"Cannot serialise unknown deliverable '{key}'. Skipping.")
+    return "\n\n".join(blocks)
+
 if __name__ == "__main__":
     mock_input=input("provide the llm reponse as string")
     print("--- Parsing Mock LLM Output (Variable Blocks Test) ---")
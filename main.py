@@ -1,10 +1,52 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from content_generation_prompts import router as prompt_router
-from content_generation_api import router as analysis_router
+from content_generation_api import router as analysis_router, get_analyzer
+from request_profiler import router as profiling_router
+from prompt_repository import warm_pool, warm_prompt_cache, close_pool
+
+logger = logging.getLogger("main")
+
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+# Each step is retried until it succeeds; /readyz reports ready once all are done.
+WARMUP_STEPS = {
+    "db_pool": warm_pool,
+    "prompts": warm_prompt_cache,
+    "llm_connection": lambda: get_analyzer().warm_up(),
+}
+
+
+async def _warm_up(app: FastAPI):
+    for name, step in WARMUP_STEPS.items():
+        while True:
+            try:
+                await asyncio.to_thread(step)
+                break
+            except Exception as e:
+                logger.warning(f"Warm-up step '{name}' failed, retrying in {WARMUP_RETRY_SECONDS}s: {e}")
+                await asyncio.sleep(WARMUP_RETRY_SECONDS)
+        app.state.pending_warmup.remove(name)
+        logger.info(f"Warm-up step '{name}' completed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background so the process answers /healthz immediately.
+    app.state.pending_warmup = list(WARMUP_STEPS)
+    warmup_task = asyncio.create_task(_warm_up(app))
+    yield
+    warmup_task.cancel()
+    close_pool()
 
-app = FastAPI(title="Unified Content Generation and Analysis API")
+
+app = FastAPI(title="Unified Content Generation and Analysis API", lifespan=lifespan)
 
 #origins = ["http://localhost:5173", "http://127.0.0.1:5173"]
 
@@ -28,9 +70,29 @@ async def catch_all_options(_: str):
 
 app.include_router(prompt_router)
 app.include_router(analysis_router)
+app.include_router(profiling_router)
 
 # Example of a simple root endpoint
 @app.get("/")
 async def root():
     return {"message": "API is online with CORS configured"}
 
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness: the process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    """
+    Readiness: the DB pool, prompt cache and LLM connection are warm.
+    """
+    pending = getattr(app.state, "pending_warmup", list(WARMUP_STEPS))
+    if pending:
+        response.status_code = 503
+        return {"status": "warming", "pending": pending}
+    return {"status": "ready"}
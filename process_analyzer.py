@@ -4,3 +4,5 @@ from typing import Optional, Dict, Any
 # This model is used to define the structure of the API's response.
 class AnalysisResult(BaseModel):
     output: Dict[str, Any]
+    # Set when the output was reused (or is offered) from a near-duplicate transcript.
+    near_duplicate: Optional[Dict[str, Any]] = None
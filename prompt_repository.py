@@ -1,8 +1,12 @@
+import hashlib
 import os
+import threading
+import time
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,48 +19,168 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT", "5432"),
 }
 
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "1"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "10"))
+
+# Prompts change rarely, so they are cached in-process. Writes through the
+# /prompts router invalidate the cache immediately; other instances pick the
+# change up once the TTL expires.
+PROMPT_CACHE_TTL_SECONDS = float(os.getenv("PROMPT_CACHE_TTL_SECONDS", "60"))
+
 logger = logging.getLogger("prompt_repository")
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
 )
 
+_pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+
+_prompt_cache: Optional[Dict] = None
+_prompt_cache_lock = threading.Lock()
+
+
+def _get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """
+    Lazily create the shared connection pool on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN_CONN, DB_POOL_MAX_CONN, **DB_CONFIG
+                )
+    return _pool
+
 
 def _get_connection():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
+        return _get_pool().getconn()
     except psycopg2.Error as e:
         logger.error(f"Database connection failed: {str(e)}")
         raise Exception("Failed to connect to database.")
 
 
-def get_core_prompt() -> str:
+def _release_connection(conn) -> None:
+    # Connections left in a failed transaction are discarded instead of reused.
+    broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    _get_pool().putconn(conn, close=bool(broken))
+
+
+def warm_pool() -> None:
     """
-    Fetch the core prompt (prompt_id = 0).
+    Open the pool and run a trivial query so the first request does not pay
+    for the TCP/TLS handshake and authentication with the database.
     """
+    conn = _get_connection()
     try:
-        conn = _get_connection()
         cur = conn.cursor()
-        cur.execute("SELECT content FROM content_generation_prompts WHERE prompt_id = 0;")
-        result = cur.fetchone()
+        cur.execute("SELECT 1;")
+        cur.fetchone()
+        cur.close()
+        conn.rollback()
+    finally:
+        _release_connection(conn)
 
-        if not result:
-            logger.error("Core prompt with prompt_id=0 not found in DB.")
-            raise Exception("Core prompt (prompt_id=0) not found.")
 
-        return result[0]
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
 
-    except psycopg2.Error as e:
-        logger.error(f"Database query error while fetching core prompt: {str(e)}")
-        raise Exception("Error querying database for core prompt.")
 
+def _fetch_prompt_rows(conn) -> List:
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    try:
+        cur.execute("SELECT prompt_id, name, content FROM content_generation_prompts;")
+        return cur.fetchall()
     finally:
+        cur.close()
+
+
+def _load_prompts() -> Dict:
+    """
+    Fetch every prompt in a single round trip.
+    Returns: {"core": str or None, "modular": {name: content}, "loaded_at": float}
+    """
+    for attempt in range(2):
+        conn = _get_connection()
         try:
-            cur.close()
+            rows = _fetch_prompt_rows(conn)
+            break
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # Pooled connections are not validated on checkout and may have been
+            # dropped while idle: discard this one and retry once with a fresh one.
             conn.close()
-        except Exception as e:
-            logger.warning(f"Error closing database connection: {str(e)}")
+            if attempt:
+                logger.error(f"Database query error while fetching prompts: {str(e)}")
+                raise Exception("Error querying database for prompts.")
+            logger.warning(f"Discarding broken pooled connection: {str(e)}")
+        except psycopg2.Error as e:
+            logger.error(f"Database query error while fetching prompts: {str(e)}")
+            raise Exception("Error querying database for prompts.")
+        finally:
+            try:
+                _release_connection(conn)
+            except Exception as e:
+                logger.warning(f"Error closing database connection: {str(e)}")
+
+    core = None
+    modular = {}
+    for row in rows:
+        if row["prompt_id"] == 0:
+            core = row["content"]
+        else:
+            modular[row["name"]] = row["content"]
+
+    return {"core": core, "modular": modular, "loaded_at": time.monotonic()}
+
+
+def _get_prompts() -> Dict:
+    global _prompt_cache
+    cache = _prompt_cache
+    if cache is None or time.monotonic() - cache["loaded_at"] > PROMPT_CACHE_TTL_SECONDS:
+        with _prompt_cache_lock:
+            cache = _prompt_cache
+            if cache is None or time.monotonic() - cache["loaded_at"] > PROMPT_CACHE_TTL_SECONDS:
+                try:
+                    cache = _load_prompts()
+                except Exception as e:
+                    if cache is None:
+                        raise
+                    # Keep serving the stale prompts; the next request past the TTL retries.
+                    logger.error(f"Prompt cache refresh failed, serving cached prompts: {str(e)}")
+                    return cache
+                _prompt_cache = cache
+    return cache
+
+
+def warm_prompt_cache() -> None:
+    """
+    Load all prompts into the in-process cache.
+    """
+    invalidate_prompt_cache()
+    _get_prompts()
+
+
+def invalidate_prompt_cache() -> None:
+    global _prompt_cache
+    with _prompt_cache_lock:
+        _prompt_cache = None
+
+
+def get_core_prompt() -> str:
+    """
+    Fetch the core prompt (prompt_id = 0).
+    """
+    core = _get_prompts()["core"]
+    if core is None:
+        logger.error("Core prompt with prompt_id=0 not found in DB.")
+        raise Exception("Core prompt (prompt_id=0) not found.")
+    return core
 
 
 def get_modular_prompts(selected_names: List[str]) -> Dict[str, str]:
@@ -67,29 +191,20 @@ def get_modular_prompts(selected_names: List[str]) -> Dict[str, str]:
     if not selected_names:
         return {}
 
-    try:
-        conn = _get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-        cur.execute("""
-            SELECT name, content FROM content_generation_prompts
-            WHERE name = ANY(%s) AND prompt_id != 0;
-        """, (selected_names,))
-
-        rows = cur.fetchall()
-        if not rows:
-            logger.warning(f"No matching modular prompts found for names: {selected_names}")
-            return {}
+    modular = _get_prompts()["modular"]
+    found = {name: modular[name] for name in selected_names if name in modular}
+    if not found:
+        logger.warning(f"No matching modular prompts found for names: {selected_names}")
+    return found
 
-        return {row["name"]: row["content"] for row in rows}
-
-    except psycopg2.Error as e:
-        logger.error(f"Database query error while fetching modular prompts: {str(e)}")
-        raise Exception("Error querying database for modular prompts.")
 
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except Exception as e:
-            logger.warning(f"Error closing database connection: {str(e)}")
+def get_prompt_version(selected_names: List[str]) -> str:
+    """
+    Short fingerprint of the core prompt plus the selected modular prompts.
+    Changes whenever any of their contents change.
+    """
+    prompts = _get_prompts()
+    digest = hashlib.sha256((prompts["core"] or "").encode("utf-8"))
+    for name in sorted(set(selected_names)):
+        digest.update(b"\0" + name.encode("utf-8") + b"\0" + prompts["modular"].get(name, "").encode("utf-8"))
+    return digest.hexdigest()[:16]
@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded during {stage}.")
+        self.stage = stage
+
+
+class RequestCancelled(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f"Request cancelled during {stage}.")
+        self.stage = stage
+
+
+class Deadline:
+    """
+    Per-request time budget shared between the request handler and the worker
+    thread running the analysis. The handler calls cancel() when the client
+    disconnects; the worker calls check() between steps and uses remaining()
+    for upstream timeouts. A child deadline shares its parent's expiry and
+    cancellation but can also be cancelled on its own (e.g. a losing hedged call).
+    """
+
+    def __init__(self, timeout_seconds: float, parent: Optional["Deadline"] = None):
+        self.timeout_seconds = timeout_seconds
+        self.expires_at = time.monotonic() + timeout_seconds
+        self.parent = parent
+        self._cancelled = threading.Event()
+        # Last stage the worker checked in from; used to attribute aborts.
+        self.stage: Optional[str] = None
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def child(self) -> "Deadline":
+        return Deadline(self.remaining(), parent=self)
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self, stage: str) -> None:
+        self.stage = stage
+        if self.parent is not None:
+            self.parent.stage = stage
+        if self.cancelled:
+            raise RequestCancelled(stage)
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+
+class CancellationStats:
+    """
+    Thread-safe counters of aborted requests, keyed by reason and stage.
+    Requests aborted before or during "llm_call" are the ones that save spend.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {"cancelled": {}, "timed_out": {}}
+
+    def record(self, error: Exception) -> None:
+        reason = "cancelled" if isinstance(error, RequestCancelled) else "timed_out"
+        stage = getattr(error, "stage", "unknown")
+        with self._lock:
+            by_stage = self._counts[reason]
+            by_stage[stage] = by_stage.get(stage, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                reason: {"total": sum(by_stage.values()), "by_stage": dict(by_stage)}
+                for reason, by_stage in self._counts.items()
+            }
+
+
+def check_deadline(deadline: Optional[Deadline], stage: str) -> None:
+    if deadline is not None:
+        deadline.check(stage)
@@ -0,0 +1,299 @@
+import asyncio
+import cProfile
+import heapq
+import hmac
+import itertools
+import logging
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response
+from fastapi.responses import FileResponse
+
+logger = logging.getLogger("request_profiler")
+
+# Profiling is only available when an admin token is configured. A request is
+# profiled when it sends "X-Profile: 1" with a matching X-Admin-Token, or when
+# it is picked by sampling (PROFILE_SAMPLE_RATE); of the sampled requests only
+# the slowest PROFILE_KEEP_SLOWEST are retained.
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP_SLOWEST = int(os.getenv("PROFILE_KEEP_SLOWEST", "10"))
+PROFILE_KEEP_REQUESTED = int(os.getenv("PROFILE_KEEP_REQUESTED", "50"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "content-generation-profiles"))
+PROFILE_TOP_N = 25
+TRUTHY_HEADER_VALUES = ("1", "true", "yes", "on")
+
+# cProfile on Python 3.12+ is built on sys.monitoring, which allows a single
+# active profiler per process, so only one request is profiled at a time.
+_active_profile_lock = threading.Lock()
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _start_tracemalloc() -> None:
+    # tracemalloc is process-wide, so concurrent profiled requests share one session.
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(PROFILING_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_ADMIN_TOKEN)
+
+
+class RequestProfile:
+    """
+    cProfile and tracemalloc capture for a single request, enabled around the
+    callables wrapped with wrap(). Only one exists at a time (see
+    _active_profile_lock). Both captures are process-wide on Python 3.12+, so
+    work done concurrently by other requests can appear in the summary.
+    """
+
+    def __init__(self, reason: str):
+        self.id = uuid.uuid4().hex
+        self.reason = reason
+        self.profiler = cProfile.Profile()
+        self.stage_seconds: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.summary: Optional[Dict[str, Any]] = None
+        _start_tracemalloc()
+        self._snapshot_before = tracemalloc.take_snapshot()
+
+    def wrap(self, stage: str, func: Callable) -> Callable:
+        def profiled(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                self.profiler.enable()
+            except Exception as e:
+                # A profiler problem must never fail the request itself.
+                logger.warning(f"Could not enable profiler for {self.id} ({stage}): {e}")
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.profiler.disable()
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - started
+        return profiled
+
+    def finish(self, status_code: int) -> Dict[str, Any]:
+        total = time.perf_counter() - self.started
+        try:
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            _stop_tracemalloc()
+        allocations = snapshot.compare_to(self._snapshot_before, "lineno")[:PROFILE_TOP_N]
+
+        # stage_seconds is only recorded for stages the profiler actually ran in;
+        # pstats cannot be built from a profiler that never collected anything.
+        functions = []
+        if self.stage_seconds:
+            stats = pstats.Stats(self.profiler)
+            functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_N]
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stats.dump_stats(self.stats_path)
+
+        self.summary = {
+            "profile_id": self.id,
+            "reason": self.reason,
+            "status_code": status_code,
+            "total_seconds": total,
+            "stage_seconds": self.stage_seconds,
+            "top_functions": [
+                {
+                    "function": f"{filename}:{line}({name})",
+                    "calls": calls,
+                    "own_seconds": own,
+                    "cumulative_seconds": cumulative,
+                }
+                for (filename, line, name), (_, calls, own, cumulative, _) in functions
+            ],
+            # Process-wide: allocations by concurrent requests are included.
+            "top_allocations": [
+                {"location": str(diff.traceback), "size_diff_bytes": diff.size_diff, "count_diff": diff.count_diff}
+                for diff in allocations
+            ],
+        }
+        return self.summary
+
+    @property
+    def stats_path(self) -> str:
+        return os.path.join(PROFILE_DIR, f"{self.id}.prof")
+
+
+class ProfileStore:
+    """
+    Keeps the most recent explicitly requested profiles and the slowest
+    sampled ones, deleting the .prof files of evicted entries.
+    """
+
+    def __init__(self, keep_requested: int = PROFILE_KEEP_REQUESTED, keep_slowest: int = PROFILE_KEEP_SLOWEST):
+        self.keep_requested = keep_requested
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+        self._requested: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self._slowest: List = []  # min-heap of (total_seconds, tiebreak, profile)
+        self._tiebreak = itertools.count()
+
+    def add(self, profile: RequestProfile) -> None:
+        evicted = []
+        with self._lock:
+            if profile.reason == "sampled":
+                heapq.heappush(self._slowest, (profile.summary["total_seconds"], next(self._tiebreak), profile))
+                if len(self._slowest) > self.keep_slowest:
+                    evicted.append(heapq.heappop(self._slowest)[2])
+            else:
+                self._requested[profile.id] = profile
+                while len(self._requested) > self.keep_requested:
+                    evicted.append(self._requested.popitem(last=False)[1])
+        for old in evicted:
+            try:
+                os.remove(old.stats_path)
+            except OSError:
+                pass
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            if profile_id in self._requested:
+                return self._requested[profile_id]
+            return next((p for _, _, p in self._slowest if p.id == profile_id), None)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self._requested.values()) + [p for _, _, p in self._slowest]
+        return sorted(
+            ({key: p.summary[key] for key in ("profile_id", "reason", "status_code", "total_seconds")} for p in profiles),
+            key=lambda s: s["total_seconds"],
+            reverse=True,
+        )
+
+
+PROFILES = ProfileStore()
+
+
+def start_profile(profile_header: Optional[str], admin_token: Optional[str]) -> Optional[RequestProfile]:
+    """
+    Returns a RequestProfile when this request should be profiled, else None.
+    Raises 403 when profiling is requested without a valid admin token. If
+    another request is already being profiled, this one runs unprofiled.
+    """
+    if profile_header and profile_header.strip().lower() in TRUTHY_HEADER_VALUES:
+        if not is_admin(admin_token):
+            raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token.")
+        reason = "requested"
+    elif PROFILE_SAMPLE_RATE > 0 and PROFILING_ADMIN_TOKEN and random.random() < PROFILE_SAMPLE_RATE:
+        reason = "sampled"
+    else:
+        return None
+
+    if not _active_profile_lock.acquire(blocking=False):
+        logger.info(f"Skipping {reason} profile: another request is already being profiled.")
+        return None
+    try:
+        return RequestProfile(reason)
+    except Exception as e:
+        _active_profile_lock.release()
+        logger.warning(f"Could not start {reason} profile: {e}")
+        return None
+
+
+def finish_profile(profile: RequestProfile, status_code: int) -> None:
+    try:
+        profile.finish(status_code)
+        PROFILES.add(profile)
+    except Exception as e:
+        logger.error(f"Failed to record profile {profile.id}: {e}")
+    finally:
+        _active_profile_lock.release()
+
+
+async def request_profile(response: Response,
+                          profile_header: Optional[str] = Header(None, alias="X-Profile"),
+                          admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """
+    FastAPI dependency yielding the RequestProfile for this request (or None).
+    It is async so unprofiled requests never hop to the threadpool; the
+    profile is finalised off the event loop once the handler returns or raises.
+    """
+    profile = start_profile(profile_header, admin_token)
+    if profile is None:
+        yield None
+        return
+
+    response.headers["X-Profile-Id"] = profile.id
+    status_code = 200
+    try:
+        yield profile
+    except HTTPException as e:
+        status_code = e.status_code
+        raise
+    except Exception:
+        status_code = 500
+        raise
+    finally:
+        await asyncio.to_thread(finish_profile, profile, status_code)
+
+
+def profiled(profile: Optional[RequestProfile], stage: str, func: Callable) -> Callable:
+    # Returns func untouched when the request is not being profiled.
+    return func if profile is None else profile.wrap(stage, func)
+
+
+# -------------------------------
+# FastAPI Router
+# -------------------------------
+router = APIRouter()
+
+
+def _require_admin(admin_token: Optional[str]) -> None:
+    if not is_admin(admin_token):
+        raise HTTPException(status_code=403, detail="A valid X-Admin-Token is required.")
+
+
+@router.get("/profiles")
+def list_profiles(admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    _require_admin(admin_token)
+    return PROFILES.list()
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    _require_admin(admin_token)
+    profile = PROFILES.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return profile.summary
+
+
+@router.get("/profiles/{profile_id}/stats")
+def download_profile_stats(profile_id: str, admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """
+    Raw cProfile data, loadable with pstats or snakeviz.
+    """
+    _require_admin(admin_token)
+    profile = PROFILES.get(profile_id)
+    if profile is None or not os.path.exists(profile.stats_path):
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(profile.stats_path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
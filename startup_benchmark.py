@@ -0,0 +1,67 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+# Measures how quickly a fresh instance becomes useful:
+#   1. import time of main.py in a clean interpreter
+#   2. time until /healthz answers (process is live)
+#   3. time until /readyz answers 200 (DB pool, prompts and LLM connection warm)
+#
+# Usage: python startup_benchmark.py [runs]
+
+PORT = int(os.getenv("BENCHMARK_PORT", "8765"))
+READY_TIMEOUT_SECONDS = float(os.getenv("BENCHMARK_READY_TIMEOUT", "60"))
+
+
+def measure_import_time() -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def _wait_for(url: str, start: float, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    return float("nan")
+
+
+def measure_time_to_first_request() -> tuple:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + READY_TIMEOUT_SECONDS
+        live = _wait_for(f"http://127.0.0.1:{PORT}/healthz", start, deadline)
+        ready = _wait_for(f"http://127.0.0.1:{PORT}/readyz", start, deadline)
+        return live, ready
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    import_times = [measure_import_time() for _ in range(runs)]
+    print(f"import main:      median {statistics.median(import_times) * 1000:.1f} ms over {runs} runs")
+
+    live_times, ready_times = zip(*(measure_time_to_first_request() for _ in range(runs)))
+    print(f"time to /healthz: median {statistics.median(live_times) * 1000:.1f} ms")
+    print(f"time to /readyz:  median {statistics.median(ready_times) * 1000:.1f} ms "
+          f"(nan = not ready within {READY_TIMEOUT_SECONDS:.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Near-duplicate detection for transcripts (re-exports of the same meeting
+# with shifted timestamps, renamed speakers or small edits). Each transcript
+# is reduced to a one-permutation MinHash signature over word shingles of its
+# cleaned utterances (each shingle is hashed once and kept as the minimum of
+# its bin), and LSH banding keeps lookups to a handful of dict probes no
+# matter how many transcripts are indexed.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "5000"))
+# Stored results are full deliverable payloads, so the index is also bounded by their JSON size.
+NEAR_DUPLICATE_MAX_BYTES = int(os.getenv("NEAR_DUPLICATE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+SHINGLE_SIZE = 5
+NUM_BINS = 64
+BANDS = 16  # 16 bands x 4 rows: candidates from ~0.5 similarity, verified against the threshold
+_BIN_BITS = 6  # log2(NUM_BINS): the top bits of a shingle hash select its bin
+_VALUE_BITS = 64 - _BIN_BITS
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+# light_cleanup splits on the first colon, so "[00:07] Alice: text" comes out as
+# "07] Alice: text". Timestamp fragments and short speaker prefixes are dropped
+# here so re-exports with shifted times or renamed speakers still match.
+_TIMESTAMP_RE = re.compile(r"\[?\b\d{1,2}(?::\d{2}){1,2}\]?|^\s*\d{1,2}\]")
+_SPEAKER_RE = re.compile(r"^\s*(?:[\w.'-]+\s){0,3}[\w.'-]+\s?:\s")
+
+Signature = Tuple[int, ...]
+
+
+def shingles(cleaned_lines: List[str], size: int = SHINGLE_SIZE) -> set:
+    """
+    Word n-grams over the normalised utterances. Shingles run across utterance
+    boundaries so that re-exports which split or merge lines still match.
+    """
+    utterances = (_SPEAKER_RE.sub("", _TIMESTAMP_RE.sub("", line)) for line in cleaned_lines)
+    words = _WORD_RE.findall(" ".join(utterances).lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash_shingle(shingle: str, key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8, key=key).digest(), "big")
+
+
+class NearDuplicateIndex:
+    """
+    In-memory MinHash/LSH index mapping transcripts to prior analysis results.
+    Entries are scoped (e.g. by deliverables and prompt version) so a match is
+    only returned for an equivalent request. The index is bounded by entry count
+    and by the approximate size of the stored results, evicting the least
+    recently used entry.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, max_entries: int = NEAR_DUPLICATE_MAX_ENTRIES,
+                 max_bytes: int = NEAR_DUPLICATE_MAX_BYTES, bands: int = BANDS, seed: int = 1):
+        if NUM_BINS % bands:
+            raise ValueError("NUM_BINS must be a multiple of bands.")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bands = bands
+        self.rows = NUM_BINS // bands
+        self._hash_key = seed.to_bytes(8, "big")
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # entry_id -> (signature, scope, result, result size in bytes)
+        self._entries: "OrderedDict[int, Tuple[Signature, Hashable, Any, int]]" = OrderedDict()
+        self._total_bytes = 0
+        # (scope, band, band values) -> entry ids
+        self._buckets: Dict[Tuple, set] = {}
+
+    def signature(self, cleaned_lines: List[str]) -> Optional[Signature]:
+        """
+        One hash per shingle, so signing is linear in the transcript length.
+        """
+        mins: List[Optional[int]] = [None] * NUM_BINS
+        for shingle in shingles(cleaned_lines):
+            h = _hash_shingle(shingle, self._hash_key)
+            b, value = h >> _VALUE_BITS, h & _VALUE_MASK
+            if mins[b] is None or value < mins[b]:
+                mins[b] = value
+        if all(m is None for m in mins):
+            return None
+        # Short transcripts leave bins empty; each borrows the next non-empty bin
+        # (offset by the distance) so equal transcripts still agree bin by bin.
+        signature = []
+        for b in range(NUM_BINS):
+            distance = 0
+            while mins[(b + distance) % NUM_BINS] is None:
+                distance += 1
+            signature.append(mins[(b + distance) % NUM_BINS] + (distance << _VALUE_BITS))
+        return tuple(signature)
+
+    def _band_keys(self, signature: Signature, scope: Hashable):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield (scope, band, signature[start:start + self.rows])
+
+    def add(self, signature: Signature, scope: Hashable, result: Any) -> Optional[int]:
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return None
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (signature, scope, result, size)
+            self._total_bytes += size
+            for key in self._band_keys(signature, scope):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                self._evict_oldest()
+            return entry_id
+
+    def _evict_oldest(self) -> None:
+        entry_id, (signature, scope, _, size) = self._entries.popitem(last=False)
+        self._total_bytes -= size
+        for key in self._band_keys(signature, scope):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def lookup(self, signature: Signature, scope: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Return the most similar prior entry in the same scope whose estimated
+        Jaccard similarity meets the threshold, or None.
+        """
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature, scope):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                other = self._entries[entry_id][0]
+                similarity = sum(x == y for x, y in zip(signature, other)) / len(signature)
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None or best_similarity < self.threshold:
+                return None
+            self._entries.move_to_end(best_id)
+            return {"analysis_id": best_id, "similarity": round(best_similarity, 4),
+                    "result": self._entries[best_id][2]}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def main():
+    """
+    Fills an index with tens of thousands of entries and times signing an
+    hour-long transcript (800 utterances) and looking up a lightly edited
+    re-export of it. Both transcripts go through ProcessAnalyzer.light_cleanup,
+    as they do in /analyze.
+    """
+    from content_generation_core import ProcessAnalyzer
+
+    analyzer = ProcessAnalyzer(azure_api_key="demo", azure_endpoint="http://localhost")
+    index = NearDuplicateIndex(max_entries=50000)
+    scope = (("summary_table",), "demo")
+    utterances = [f"the analyst reviews invoice batch {i} with the team and flags the exceptions for approval."
+                  for i in range(800)]
+    original = "\n".join(f"[00:{i % 60:02d}] Alice: {line}" for i, line in enumerate(utterances))
+    utterances[10] = "the analyst double checks invoice batch 10 before flagging exceptions."
+    edited = "\n".join(f"[01:{(i + 7) % 60:02d}] Speaker {i % 3}: {line}" for i, line in enumerate(utterances))
+
+    def cleaned(text: str) -> List[str]:
+        return analyzer.light_cleanup(analyzer.load_transcript(text))
+
+    rng = random.Random(7)
+    for _ in range(30000):
+        index.add(tuple(rng.randrange(1 << _VALUE_BITS) for _ in range(NUM_BINS)), scope, {"filler": True})
+    index.add(index.signature(cleaned(original)), scope, {"summary_table": "original result"})
+
+    started = time.perf_counter()
+    query = index.signature(cleaned(edited))
+    signature_seconds = time.perf_counter() - started
+
+    runs = 1000
+    started = time.perf_counter()
+    for _ in range(runs):
+        match = index.lookup(query, scope)
+    elapsed = (time.perf_counter() - started) / runs
+    print(f"entries: {len(index)}, words: {sum(len(line.split()) for line in utterances)}, "
+          f"signature: {signature_seconds * 1e3:.1f} ms, "
+          f"lookup: {elapsed * 1e6:.1f} us, match: {match and match['similarity']}")
+
+
+if __name__ == "__main__":
+    main()